@@ -32,6 +32,8 @@
 # pylint: disable=too-many-return-statements
 # pylint: disable=too-many-branches
 
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from bisect import bisect_left
 from datetime import datetime
 from http import HTTPStatus
 from urllib.parse import urlparse
@@ -39,8 +41,10 @@ from urllib.parse import urlparse
 import os
 import sys
 import argparse
+import hashlib
 import logging
 import json
+import threading
 import time
 import requests
 import urllib3
@@ -65,6 +69,18 @@ logging.addLevelName(VERBOSE2, "VERBOSE2")
 
 SECONDS_PER_MINUTE = 60
 
+# Call times are kept in a histogram with fixed, logarithmically spaced bucket
+# bounds from 1 ms to 100 s so that memory use does not grow with the number of
+# calls. 50 buckets per decade keeps each bucket within 5% of its neighbours.
+LATENCY_BUCKETS_PER_DECADE = 50
+LATENCY_BUCKET_BOUNDS = [0.001 * 10 ** (i / LATENCY_BUCKETS_PER_DECADE) for i in range(5 * LATENCY_BUCKETS_PER_DECADE + 1)]
+
+# Per-URL statistics are keyed by path without host or query. Once this many
+# paths have been seen, calls to new paths are counted together under
+# URL_STATS_OTHER so that traces of unique URIs do not grow memory or results.
+MAX_URL_STATS = 1000
+URL_STATS_OTHER = 'other'
+
 class PerfData:
     """
     Performance Data class
@@ -76,6 +92,11 @@ class PerfData:
     failures
     max_call_url
     min_call_url
+    max_lag
+    latency_buckets
+    latency_count
+    latency_total
+    url_stats
     """
     rate = 0
     final_rate = 0
@@ -85,9 +106,16 @@ class PerfData:
     failures = 0
     max_call_url = ""
     min_call_url = ""
+    max_lag = 0.0
+
+    def __init__(self):
+        # Replay issues multiplied requests from several threads at once
+        self.lock = threading.Lock()
+        self.reset_calls()
 
     def add_rate(self, val):
-        self.rate += val
+        with self.lock:
+            self.rate += val
 
     def reset_rate(self):
         self.rate = 0
@@ -110,11 +138,47 @@ class PerfData:
     def set_avg_call(self, val):
         self.avg_call = val
 
-    def add_failure(self):
-        self.failures += 1
-
+    def set_max_lag(self, val):
+        self.max_lag = val
 
-def doCall(args, data, url):
+    def add_failure(self):
+        with self.lock:
+            self.failures += 1
+
+    def reset_failures(self):
+        self.failures = 0
+
+    def reset_calls(self):
+        # The extra bucket holds calls slower than the last bound
+        self.latency_buckets = [0] * (len(LATENCY_BUCKET_BOUNDS) + 1)
+        self.latency_count = 0
+        self.latency_total = 0.0
+        self.url_stats = {}
+
+    def add_call(self, url, call_time, failed):
+        # Only successful calls count towards call times, failed calls such as
+        # timeouts are reported through the failure counts
+        with self.lock:
+            if url not in self.url_stats and len(self.url_stats) >= MAX_URL_STATS:
+                url = URL_STATS_OTHER
+            stats = self.url_stats.setdefault(url, {'count': 0, 'failures': 0, 'successes': 0, 'total': 0.0, 'max': 0.0, 'min': 0.0})
+            stats['count'] += 1
+            if failed:
+                stats['failures'] += 1
+                return
+
+            self.latency_buckets[bisect_left(LATENCY_BUCKET_BOUNDS, call_time)] += 1
+            self.latency_count += 1
+            self.latency_total += call_time
+
+            if stats['successes'] == 0 or call_time < stats['min']:
+                stats['min'] = call_time
+            stats['max'] = max(stats['max'], call_time)
+            stats['successes'] += 1
+            stats['total'] += call_time
+
+
+def doCall(args, data, url, method='GET'):
     # Until certificates or sessions are being used to talk to Redfish
     # endpoints the basic auth method will be used. To do so, SSL verification
     # needs to be turned off which results in a InsecureRequestWarning. The
@@ -126,19 +190,21 @@ def doCall(args, data, url):
         'cache-control': 'no-cache',
     }
 
+    path = urlparse(url).path
     url = args.ip + url
     data.add_rate(1)
     start_call = time.time()
 
     try:
-        rsp = requests.get(url=url, headers=headers, auth=auth, verify=False,
-                    timeout=30)
+        rsp = requests.request(method, url=url, headers=headers, auth=auth,
+                    verify=False, timeout=30)
 
     except Exception as e:
         my_logger.log(VERBOSE1, 'Exception caught in doCall')
         my_logger.error('Unable to get URL %s %s', url, repr(e))
         end_call = time.time()
         call_time = end_call - start_call
+        data.add_call(path, call_time, True)
         return call_time, None
 
     end_call = time.time()
@@ -146,19 +212,24 @@ def doCall(args, data, url):
 
     if rsp.status_code == HTTPStatus.UNAUTHORIZED:
         my_logger.error("Authentication error trying to get URL %s", url)
+        data.add_call(path, call_time, True)
         return call_time, None
 
     if rsp.status_code >= HTTPStatus.MULTIPLE_CHOICES:
         my_logger.error("Error requesting URL %s: %s", url, HTTPStatus(rsp.status_code))
+        data.add_call(path, call_time, True)
         return call_time, None
 
-    if call_time > data.max_call:
-        data.set_max_call_time(call_time)
-        data.set_max_call_url(url)
+    data.add_call(path, call_time, False)
+
+    with data.lock:
+        if call_time > data.max_call:
+            data.set_max_call_time(call_time)
+            data.set_max_call_url(url)
 
-    if call_time < data.min_call:
-        data.set_min_call_time(call_time)
-        data.set_min_call_url(url)
+        if call_time < data.min_call:
+            data.set_min_call_time(call_time)
+            data.set_min_call_url(url)
 
     return call_time, rsp
 
@@ -197,8 +268,9 @@ def doRequests(args, data, rpm, runtime):
     data.set_max_call_url("")
     data.set_min_call_time(9999)
     data.set_min_call_url("")
+    data.reset_failures()
+    data.reset_calls()
 
-    avg_arr = []
     sleeptime = SECONDS_PER_MINUTE / rpm
 
     runsecs = runtime * SECONDS_PER_MINUTE
@@ -221,8 +293,6 @@ def doRequests(args, data, rpm, runtime):
             data.add_failure()
             my_logger.error('Poll request to %s failed', url)
 
-        avg_arr.append(call_time)
-
         total_time = last_request - start_requests
         my_logger.log(VERBOSE2,
             'doRequests: call %d: call_time: %.2f time accumulated: %.2f',
@@ -231,12 +301,200 @@ def doRequests(args, data, rpm, runtime):
         if call_time < sleeptime:
             time.sleep(sleeptime - call_time)
 
-    data.set_avg_call(sum(avg_arr) / len(avg_arr))
+    data.set_avg_call(data.latency_total / max(data.latency_count, 1))
     data.set_final_rate(data.rate / (total_time / SECONDS_PER_MINUTE))
     my_logger.log(VERBOSE1, 'doRequests: took: %.2f s', total_time)
     return 0
 
 
+REPLAY_METHODS = ['GET', 'HEAD']
+
+# Falling further than this behind the trace schedule means the replay no
+# longer reproduces the recorded rate
+REPLAY_LAG_WARNING = 1.0
+
+
+def parseTraceTimestamp(field):
+    try:
+        return float(field)
+    except ValueError:
+        pass
+
+    # ISO 8601, with a trailing Z accepted for UTC
+    if field.endswith('Z'):
+        field = field[:-1] + '+00:00'
+    return datetime.fromisoformat(field).timestamp()
+
+
+def readTrace(tracefile):
+    """Stream (timestamp, method, uri) entries from a recorded trace
+
+    Each line holds a timestamp (epoch seconds or ISO 8601), an HTTP method and
+    a URI, separated by commas or whitespace. Blank lines and lines starting
+    with '#' are ignored, lines that are not valid UTF-8 are skipped. The file
+    is read one line at a time so traces of any length can be replayed without
+    loading them into memory.
+    """
+    with open(tracefile, 'r', encoding='utf-8', errors='replace') as f:
+        for lineno, line in enumerate(f, start=1):
+            line = line.strip()
+            if line == '' or line.startswith('#'):
+                continue
+
+            if '\ufffd' in line:
+                my_logger.error('Skipping trace line %d that is not valid UTF-8', lineno)
+                continue
+
+            fields = line.replace(',', ' ').split()
+            if len(fields) != 3:
+                my_logger.error('Skipping malformed trace line %d: %s', lineno, line)
+                continue
+
+            try:
+                timestamp = parseTraceTimestamp(fields[0])
+            except ValueError:
+                my_logger.error('Skipping trace line %d with bad timestamp: %s', lineno, fields[0])
+                continue
+
+            # Only the path and query of the recorded URI are replayed, the
+            # host always comes from --ip
+            uri = urlparse(fields[2])
+            path = uri.path if uri.query == '' else uri.path + '?' + uri.query
+
+            yield timestamp, fields[1].upper(), path
+
+
+def replayCall(args, data, url, method):
+    call_time, rsp = doCall(args, data, url, method)
+    return call_time, rsp, url, method, time.time()
+
+
+def collectReplayCalls(data, futures, start_requests):
+    # Count and log finished replay calls, returning how many there were and
+    # when the last of them finished
+    count = 0
+    last_request = start_requests
+    for f in futures:
+        call_time, rsp, url, method, end_call = f.result()
+        if rsp is None:
+            data.add_failure()
+            my_logger.error('Replay request %s %s failed', method, url)
+
+        count += 1
+        last_request = max(last_request, end_call)
+
+        my_logger.log(VERBOSE2,
+            'doReplay: %s %s call_time: %.2f time accumulated: %.2f',
+            method, url, call_time, end_call - start_requests)
+
+    return count, last_request
+
+
+def doReplay(args, data, tracefile, time_scale, rate_multiplier, max_in_flight):
+    data.reset_rate()
+    data.set_max_call_time(0)
+    data.set_max_call_url("")
+    data.set_min_call_time(9999)
+    data.set_min_call_url("")
+    data.reset_failures()
+    data.reset_calls()
+    data.set_max_lag(0.0)
+
+    call_count = 0
+    skipped = 0
+    out_of_order = 0
+    max_lag = 0.0
+
+    my_logger.log(VERBOSE2,
+        'doReplay: trace: %s time scale: %.2f rate multiplier: %d max in flight: %d',
+        tracefile, time_scale, rate_multiplier, max_in_flight)
+
+    if not os.path.isfile(tracefile):
+        my_logger.error('Replay trace %s not found', tracefile)
+        return 1
+
+    first_timestamp = latest_timestamp = None
+    start_requests = last_request = time.time()
+    pending = set()
+
+    # Calls are issued on the trace schedule without waiting for earlier
+    # responses, so overlapping entries from several pollers overlap on the
+    # BMC as well. The replay only waits once max_in_flight calls are
+    # outstanding, and that wait shows up as schedule lag.
+    with ThreadPoolExecutor(max_workers=max_in_flight) as executor:
+        try:
+            for timestamp, method, url in readTrace(tracefile):
+                if method not in REPLAY_METHODS:
+                    my_logger.log(VERBOSE1, 'doReplay: skipping %s %s, only %s are replayed', method, url, ', '.join(REPLAY_METHODS))
+                    skipped += 1
+                    continue
+
+                if first_timestamp is None:
+                    first_timestamp = latest_timestamp = timestamp
+
+                # Merged logs are not always sorted, entries that go back in
+                # time are issued straight away and do not count as lag
+                in_order = timestamp >= latest_timestamp
+                if in_order:
+                    latest_timestamp = timestamp
+                else:
+                    my_logger.log(VERBOSE1, 'doReplay: %s %s is earlier than a previous entry, replaying it now', method, url)
+                    out_of_order += 1
+
+                # Schedule against the absolute start of the replay rather
+                # than the previous call so that slow calls do not accumulate
+                # drift
+                due = start_requests + (timestamp - first_timestamp) * time_scale
+                now = time.time()
+                if in_order and due > now:
+                    time.sleep(due - now)
+
+                for _ in range(rate_multiplier):
+                    if len(pending) >= max_in_flight:
+                        done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                        count, finished = collectReplayCalls(data, done, start_requests)
+                        call_count += count
+                        last_request = max(last_request, finished)
+
+                    lag = time.time() - due
+                    if in_order and lag > max_lag:
+                        max_lag = lag
+
+                    pending.add(executor.submit(replayCall, args, data, url, method))
+
+                done = {f for f in pending if f.done()}
+                pending -= done
+                count, finished = collectReplayCalls(data, done, start_requests)
+                call_count += count
+                last_request = max(last_request, finished)
+
+        except OSError as e:
+            my_logger.error('Unable to read replay trace %s: %s', tracefile, repr(e))
+            return 1
+
+        finally:
+            count, finished = collectReplayCalls(data, pending, start_requests)
+            call_count += count
+            last_request = max(last_request, finished)
+
+    if call_count == 0:
+        my_logger.error('No replayable entries found in %s', tracefile)
+        return 1
+
+    total_time = last_request - start_requests
+    data.set_avg_call(data.latency_total / max(data.latency_count, 1))
+    data.set_final_rate(data.rate / (max(total_time, 1e-6) / SECONDS_PER_MINUTE))
+    data.set_max_lag(max_lag)
+    if skipped > 0:
+        my_logger.info('Skipped %d trace entries with unsupported methods', skipped)
+    if out_of_order > 0:
+        my_logger.warning('Replayed %d trace entries that were earlier than a previous entry without delay', out_of_order)
+    if max_lag > REPLAY_LAG_WARNING:
+        my_logger.warning('Replay fell up to %.2f s behind the trace schedule, the achieved rate is lower than recorded', max_lag)
+    my_logger.log(VERBOSE1, 'doReplay: took: %.2f s', total_time)
+    return 0
+
+
 def prepareSystemsCall(args):
     # Until certificates or sessions are being used to talk to Redfish endpoints
     # the basic auth method will be used. To do so, SSL verification needs to be
@@ -432,8 +690,9 @@ def doRFWalk(args, data, count, runtime):
     data.set_max_call_url("")
     data.set_min_call_time(9999)
     data.set_min_call_url("")
+    data.reset_failures()
+    data.reset_calls()
 
-    avg_arr = []
     walk_count = 0
 
     runsecs = runtime * SECONDS_PER_MINUTE
@@ -447,9 +706,8 @@ def doRFWalk(args, data, count, runtime):
         ###################################################################
         # Service Root
         ###################################################################
-        call_time, service_root = doGenericURICall(args, data, "/redfish/v1/", "Service Root")
+        _, service_root = doGenericURICall(args, data, "/redfish/v1/", "Service Root")
         cur_time = time.time()
-        avg_arr.append(call_time)
 
         if (cur_time - start_time) > runsecs:
             my_logger.info("Reached max time during iteration %d while getting the service root", walk_count)
@@ -465,9 +723,8 @@ def doRFWalk(args, data, count, runtime):
         ###################################################################
         for uri in uriList:
             my_logger.log(VERBOSE2, "Handling uri %s", str(uri))
-            call_time, payload = doGenericURICall(args, data, uri[URL], uri[LABEL])
+            _, payload = doGenericURICall(args, data, uri[URL], uri[LABEL])
             cur_time = time.time()
-            avg_arr.append(call_time)
 
             if (cur_time - start_time) > runsecs:
                 my_logger.info("Reached max time during iteration %d while getting %s", walk_count, uri[LABEL])
@@ -498,18 +755,249 @@ def doRFWalk(args, data, count, runtime):
                 else:
                     my_logger.log(VERBOSE2, "No match for @odata.type %s for %s", payload['@odata.type'], str(uri))
 
-    data.set_avg_call(sum(avg_arr) / len(avg_arr))
+    data.set_avg_call(data.latency_total / max(data.latency_count, 1))
     total_time = cur_time - start_time
     data.set_final_rate(data.rate / (total_time / SECONDS_PER_MINUTE))
     my_logger.log(VERBOSE1, 'doRFWalk made %d calls over %.2f s', data.rate, total_time)
     return 0
 
 
+PERCENTILES = [50, 90, 95, 99]
+
+# Arguments that do not describe the workload and are left out of the result
+# config or ignored when checking that a baseline ran the same workload
+PRIVATE_ARGS = ['password']
+ENVIRONMENT_ARGS = ['ip', 'username', 'password', 'description', 'config', 'logdir', 'debugging', 'verbose',
+                    'results_file', 'baseline', 'rate_tolerance', 'latency_tolerance', 'failure_tolerance',
+                    'allow_workload_mismatch']
+
+# Latency statistics compared against a baseline, higher is worse
+LATENCY_METRICS = ['avg', 'p50', 'p95']
+
+# argparse exits with 2 on usage errors, so a regression needs its own code
+EXIT_REGRESSION = 3
+
+
+def percentile(data, pct):
+    # Nearest-rank percentile from the call time histogram, reported as the
+    # upper bound of its bucket and kept within the observed min and max
+    rank = max(int(-(-pct * data.latency_count // 100)), 1)
+    seen = 0
+    for i, count in enumerate(data.latency_buckets):
+        seen += count
+        if seen >= rank:
+            bound = LATENCY_BUCKET_BOUNDS[i] if i < len(LATENCY_BUCKET_BOUNDS) else data.max_call
+            return min(max(bound, data.min_call), data.max_call)
+    return data.max_call
+
+
+def buildTestResult(data):
+    # All call time fields cover successful calls only and are null when no
+    # call succeeded
+    call_time = dict.fromkeys(['max', 'min', 'avg'] + [f'p{pct}' for pct in PERCENTILES])
+    if data.latency_count > 0:
+        call_time['max'] = data.max_call
+        call_time['min'] = data.min_call
+        call_time['avg'] = data.latency_total / data.latency_count
+        for pct in PERCENTILES:
+            call_time[f'p{pct}'] = percentile(data, pct)
+
+    urls = {}
+    for url, stats in sorted(data.url_stats.items()):
+        urls[url] = {
+            'count': stats['count'],
+            'failures': stats['failures'],
+            'max': stats['max'] if stats['successes'] > 0 else None,
+            'min': stats['min'] if stats['successes'] > 0 else None,
+            'avg': stats['total'] / stats['successes'] if stats['successes'] > 0 else None,
+        }
+
+    return {
+        'status': 'passed',
+        'rate': data.final_rate,
+        'calls': data.rate,
+        'failures': data.failures,
+        'call_time': call_time,
+        'max_call_url': data.max_call_url if data.latency_count > 0 else None,
+        'min_call_url': data.min_call_url if data.latency_count > 0 else None,
+        'urls': urls,
+    }
+
+
+def hashTrace(tracefile):
+    # Identify a replay trace by content so that the same trace at another
+    # path still matches a baseline
+    sha = hashlib.sha256()
+    try:
+        with open(tracefile, 'rb') as f:
+            for chunk in iter(lambda: f.read(1024 * 1024), b''):
+                sha.update(chunk)
+
+    except OSError as e:
+        my_logger.error('Unable to read replay trace %s: %s', tracefile, repr(e))
+        return None
+
+    return sha.hexdigest()
+
+
+def writeResults(results, filename):
+    try:
+        with open(filename, 'w', encoding='utf-8') as f:
+            json.dump(results, f, indent=2, sort_keys=True)
+
+    except Exception as e:
+        my_logger.error('Unable to write results to %s: %s', filename, repr(e))
+        return 1
+
+    my_logger.info('Results written to %s', filename)
+    return 0
+
+
+def loadResults(filename):
+    try:
+        with open(filename, 'r', encoding='utf-8') as f:
+            return json.load(f)
+
+    except Exception as e:
+        my_logger.error('Unable to load results from %s: %s', filename, repr(e))
+        return None
+
+
+def isNumber(val):
+    return isinstance(val, (int, float)) and not isinstance(val, bool)
+
+
+def checkBaseline(results, baseline, allow_workload_mismatch):
+    """Check that a baseline can be compared against this run
+
+    The baseline must hold a passed result with a rate, failure count and
+    latency statistics for every test, and must have run the same workload
+    unless allow_workload_mismatch is set. Returns 0 if the baseline is usable.
+    """
+    if (not isinstance(baseline, dict)
+        or not isinstance(baseline.get('config'), dict)
+        or not isinstance(baseline.get('tests'), dict)):
+        my_logger.error('Baseline is missing its config or tests')
+        return 1
+
+    for test, base in sorted(baseline['tests'].items()):
+        if not isinstance(base, dict) or base.get('status', 'passed') != 'passed':
+            my_logger.error('Baseline %s test did not pass', test)
+            return 1
+
+        if (not isNumber(base.get('rate'))
+            or not isNumber(base.get('failures'))
+            or not isinstance(base.get('call_time'), dict)):
+            my_logger.error('Baseline %s test is missing its rate, failures or call times', test)
+            return 1
+
+        for metric in LATENCY_METRICS:
+            if metric not in base['call_time'] or not (base['call_time'][metric] is None or isNumber(base['call_time'][metric])):
+                my_logger.error('Baseline %s test is missing its %s call time', test, metric)
+                return 1
+
+    mismatches = 0
+    for key in sorted(results['config'].keys() | baseline['config'].keys()):
+        # The trace is compared by content below rather than by path
+        if key in ENVIRONMENT_ARGS or key == 'test_replay':
+            continue
+        if results['config'].get(key) != baseline['config'].get(key):
+            my_logger.log(logging.WARNING if allow_workload_mismatch else logging.ERROR,
+                'Baseline was run with %s: %s, this run used %s', key, baseline['config'].get(key), results['config'].get(key))
+            mismatches += 1
+
+    if results.get('trace_sha256') != baseline.get('trace_sha256'):
+        my_logger.log(logging.WARNING if allow_workload_mismatch else logging.ERROR,
+            'Baseline replayed trace %s (sha256 %s), this run replayed %s (sha256 %s)',
+            baseline['config'].get('test_replay'), baseline.get('trace_sha256'),
+            results['config'].get('test_replay'), results.get('trace_sha256'))
+        mismatches += 1
+
+    if mismatches > 0 and not allow_workload_mismatch:
+        my_logger.error('Baseline ran a different workload, use --allow_workload_mismatch to compare anyway')
+        return 1
+
+    return 0
+
+
+def compareResults(results, baseline, rate_tolerance, latency_tolerance, failure_tolerance):
+    """Compare a run against a baseline run
+
+    Rates may drop by at most rate_tolerance percent and latencies may grow by
+    at most latency_tolerance percent. At most failure_tolerance failures more
+    than the baseline are allowed. A test in the baseline that this run did not
+    execute is a regression. Returns the number of regressions found.
+    """
+    regressions = 0
+    compared = 0
+
+    my_logger.info('Baseline firmware: %s, this run: %s', baseline.get('firmware'), results.get('firmware'))
+
+    for test in sorted(results['tests'].keys() | baseline['tests'].keys()):
+        if test not in baseline['tests']:
+            my_logger.warning('Baseline has no results for the %s test', test)
+            continue
+
+        if test not in results['tests']:
+            my_logger.error('REGRESSION %s test is in the baseline but was not run', test)
+            regressions += 1
+            continue
+
+        result = results['tests'][test]
+        base = baseline['tests'][test]
+        compared += 1
+        my_logger.info('Comparing %s test against baseline', test)
+
+        floor = base['rate'] * (1 - rate_tolerance / 100)
+        if result['rate'] < floor:
+            my_logger.error('\tREGRESSION rate (requests/min): %.2f, baseline %.2f, allowed %.2f',
+                result['rate'], base['rate'], floor)
+            regressions += 1
+        else:
+            my_logger.info('\tRate (requests/min): %.2f, baseline %.2f', result['rate'], base['rate'])
+
+        for metric in LATENCY_METRICS:
+            if base['call_time'][metric] is None:
+                my_logger.warning('\tBaseline has no successful calls to compare %s call time against', metric)
+                continue
+
+            ceiling = base['call_time'][metric] * (1 + latency_tolerance / 100)
+            if result['call_time'][metric] is None:
+                my_logger.error('\tREGRESSION %s call time (seconds): no successful calls, baseline %.3f',
+                    metric, base['call_time'][metric])
+                regressions += 1
+            elif result['call_time'][metric] > ceiling:
+                my_logger.error('\tREGRESSION %s call time (seconds): %.3f, baseline %.3f, allowed %.3f',
+                    metric, result['call_time'][metric], base['call_time'][metric], ceiling)
+                regressions += 1
+            else:
+                my_logger.info('\t%s call time (seconds): %.3f, baseline %.3f',
+                    metric.capitalize(), result['call_time'][metric], base['call_time'][metric])
+
+        allowed = base['failures'] + failure_tolerance
+        if result['failures'] > allowed:
+            my_logger.error('\tREGRESSION failures: %d, baseline %d, allowed %d',
+                result['failures'], base['failures'], allowed)
+            regressions += 1
+        else:
+            my_logger.info('\tFailures: %d, baseline %d', result['failures'], base['failures'])
+
+    if compared == 0:
+        my_logger.error('REGRESSION no tests in common with the baseline')
+        regressions += 1
+
+    return regressions
+
+
 def main(argslist=None, configfile=None):
     """Main command
 
     Args:
         argslist ([type], optional): List of arguments in the form of argv. Defaults to None.
+
+    Returns:
+        int: 0 on success, 1 on error, EXIT_REGRESSION (3) if a baseline comparison found a regression.
+        Usage errors exit with 2 from argparse.
     """
     parser = argparse.ArgumentParser(description=f'HPE tool to stress test a Redfish implementation, version {TOOL_VERSION}')
 
@@ -532,9 +1020,30 @@ def main(argslist=None, configfile=None):
     parser.add_argument('--runtime', type=int, default=1, help='Length of time to run stress test. Default 1 minute')
     parser.add_argument('--test_rf_walk', action='store_true', help='Walk the Redfish tree from the root')
     parser.add_argument('--walk_count', type=int, default=1, help='Number of times to walk the Redfish tree. Default 1')
+    parser.add_argument('--test_replay', type=str, metavar='TRACEFILE', help='Replay a recorded trace of timestamp, method, URI lines')
+    parser.add_argument('--replay_time_scale', type=float, default=1.0, help='Multiplier applied to the gaps between trace entries. Default 1.0')
+    parser.add_argument('--replay_rate_multiplier', type=int, default=1, help='Number of requests issued for each trace entry. Default 1')
+    parser.add_argument('--replay_max_in_flight', type=int, default=32, help='Maximum number of replay requests outstanding at once. Default 32')
+
+    # Results options
+    parser.add_argument('--results_file', type=str, help='File for JSON results, if none is given, write to the log directory')
+    parser.add_argument('--baseline', type=str, help='JSON results of a previous run to compare this run against')
+    parser.add_argument('--rate_tolerance', type=float, default=10.0, help='Percent drop in rate allowed against the baseline. Default 10')
+    parser.add_argument('--latency_tolerance', type=float, default=20.0, help='Percent increase in call times allowed against the baseline. Default 20')
+    parser.add_argument('--failure_tolerance', type=int, default=0, help='Number of failures allowed above the baseline. Default 0')
+    parser.add_argument('--allow_workload_mismatch', action='store_true', help='Compare against a baseline that ran a different workload')
 
     args = parser.parse_args(argslist)
 
+    if args.replay_time_scale < 0:
+        parser.error('--replay_time_scale must not be negative')
+
+    if args.replay_rate_multiplier < 1:
+        parser.error('--replay_rate_multiplier must be at least 1')
+
+    if args.replay_max_in_flight < 1:
+        parser.error('--replay_max_in_flight must be at least 1')
+
     data = PerfData()
 
     if configfile is None:
@@ -562,7 +1071,7 @@ def main(argslist=None, configfile=None):
     if args.ip is None and configfile is None:
         my_logger.error('No IP or Config Specified')
         parser.print_help()
-        return 1, None, 'Configuration Incomplete'
+        return 1
 
     # Handle config file
     #
@@ -580,11 +1089,11 @@ def main(argslist=None, configfile=None):
     scheme, netloc, _, _, _, _ = urlparse(args.ip)
     if scheme not in ['http', 'https']:
         my_logger.error('IP is missing http or https')
-        return 1, None, 'IP Incomplete'
+        return 1
 
     if netloc == '':
         my_logger.error('IP is missing ip/host')
-        return 1, None, 'IP Incomplete'
+        return 1
 
     # start printing config details, remove redundant/private info from print
     my_logger.info('Target URI: %s', args.ip)
@@ -597,6 +1106,20 @@ def main(argslist=None, configfile=None):
     my_logger.info('BMC Firmware Version: %s', firmware)
     my_logger.info("")
 
+    results = {
+        'tool_version': TOOL_VERSION,
+        'start_time': startTick.isoformat(),
+        'firmware': firmware,
+        'config': {x: vars(args)[x] for x in sorted(vars(args).keys() - set(PRIVATE_ARGS))},
+        'status': 'passed',
+        'tests': {},
+        'trace_sha256': hashTrace(args.test_replay) if args.test_replay is not None and os.path.isfile(args.test_replay) else None,
+    }
+
+    results_file = args.results_file
+    if results_file is None:
+        results_file = datetime.strftime(startTick, os.path.join(logpath, "Results_%m_%d_%Y_%H%M%S.json"))
+
     # Start Main
     #status_code = 1
     #jsonData = None
@@ -634,6 +1157,9 @@ def main(argslist=None, configfile=None):
         ret = doRequests(args, data, rpm, runtime)
         if ret != 0:
             my_logger.info('Request rate statistics failed')
+            results['status'] = 'failed'
+            results['tests']['requests'] = {'status': 'failed'}
+            writeResults(results, results_file)
             return 1
 
         my_logger.info('Request rate statistics')
@@ -644,6 +1170,8 @@ def main(argslist=None, configfile=None):
         my_logger.info('\tNumber of Redfish calls: %d', data.rate)
         my_logger.info('\tNumber of failures: %d', data.failures)
 
+        results['tests']['requests'] = buildTestResult(data)
+
     ###########################################################################
     # Execute HSM style Redfish walk
     #
@@ -666,6 +1194,9 @@ def main(argslist=None, configfile=None):
         ret = doRFWalk(args, data, count, runtime)
         if ret != 0:
             my_logger.info('Redfish walk rate statistics failed')
+            results['status'] = 'failed'
+            results['tests']['rf_walk'] = {'status': 'failed'}
+            writeResults(results, results_file)
             return 1
 
         my_logger.info('Redfish discovery walk rate statistics')
@@ -676,6 +1207,77 @@ def main(argslist=None, configfile=None):
         my_logger.info('\tNumber of Redfish calls: %d', data.rate)
         my_logger.info('\tNumber of failures: %d', data.failures)
 
+        results['tests']['rf_walk'] = buildTestResult(data)
+
+    ###########################################################################
+    # Execute trace replay
+    #
+    # Replay a recorded production trace as it happened
+    #   --test_replay trace.txt
+    #
+    # Replay twice as fast, at three times the load
+    #   --test_replay trace.txt
+    #   --replay_time_scale 0.5
+    #   --replay_rate_multiplier 3
+    #   --replay_max_in_flight 32
+    ###########################################################################
+    if args.test_replay is not None:
+        my_logger.info("******************************************************")
+        my_logger.info("Begin trace replay of %s", args.test_replay)
+
+        ret = doReplay(args, data, args.test_replay, args.replay_time_scale, args.replay_rate_multiplier, args.replay_max_in_flight)
+        if ret != 0:
+            my_logger.info('Trace replay rate statistics failed')
+            results['status'] = 'failed'
+            results['tests']['replay'] = {'status': 'failed'}
+            writeResults(results, results_file)
+            return 1
+
+        my_logger.info('Trace replay rate statistics')
+        my_logger.info('\tRate achieved (requests/min): %d', data.final_rate)
+        my_logger.info('\tMax call time (seconds) and url: %.2f (%s)', data.max_call, data.max_call_url)
+        my_logger.info('\tMin call time (seconds) and url: %.2f (%s)', data.min_call, data.min_call_url)
+        my_logger.info('\tAvg call time (seconds): %.2f', data.avg_call)
+        my_logger.info('\tNumber of Redfish calls: %d', data.rate)
+        my_logger.info('\tNumber of failures: %d', data.failures)
+        my_logger.info('\tMax schedule lag (seconds): %.2f', data.max_lag)
+
+        results['tests']['replay'] = buildTestResult(data)
+        results['tests']['replay']['max_lag'] = data.max_lag
+
+    ###########################################################################
+    # Write JSON results and compare against a baseline
+    #
+    # Gate a new firmware on a previous run
+    #   --baseline logs/Results_01_02_2023_030405.json
+    #   --rate_tolerance 10
+    #   --latency_tolerance 20
+    #   --failure_tolerance 0
+    #
+    # Compare anyway when the baseline ran a different workload
+    #   --allow_workload_mismatch
+    ###########################################################################
+    if writeResults(results, results_file) != 0:
+        return 1
+
+    if args.baseline is not None:
+        my_logger.info("******************************************************")
+        my_logger.info("Compare against baseline %s", args.baseline)
+
+        baseline = loadResults(args.baseline)
+        if baseline is None:
+            return 1
+
+        if checkBaseline(results, baseline, args.allow_workload_mismatch) != 0:
+            return 1
+
+        regressions = compareResults(results, baseline, args.rate_tolerance, args.latency_tolerance, args.failure_tolerance)
+        if regressions > 0:
+            my_logger.error('Found %d performance regressions against the baseline', regressions)
+            return EXIT_REGRESSION
+
+        my_logger.info('No performance regressions against the baseline')
+
     return 0
 
 if __name__ == '__main__':